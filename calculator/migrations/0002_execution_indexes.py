@@ -0,0 +1,21 @@
+# Generated by Django 6.0.1 on 2026-10-15 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calculator', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='execution',
+            index=models.Index(fields=['-created_at'], name='execution_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='execution',
+            index=models.Index(fields=['status'], name='execution_status_idx'),
+        ),
+    ]
@@ -26,6 +26,10 @@ class Execution(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='execution_created_at_idx'),
+            models.Index(fields=['status'], name='execution_status_idx'),
+        ]
 
     def __str__(self):
         return f"Execution {self.id} - {self.status} ({self.created_at.strftime('%Y-%m-%d %H:%M')})"
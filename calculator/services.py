@@ -13,11 +13,32 @@ For each employee, from current age to retirement:
 - Expected Death Outflow = Future Salary * survival * death
 """
 
+import atexit
 import csv
+import functools
 import io
+import multiprocessing
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 from decimal import Decimal
-from typing import BinaryIO
+from typing import BinaryIO, TextIO
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional, the NumPy kernel is used instead
+    njit = None
+    prange = range
+
+try:
+    import polars as pl
+except ImportError:  # polars is optional, results are written with the csv module instead
+    pl = None
 
 
 # Default probability lookup table (age -> (qx, px))
@@ -43,40 +64,270 @@ DEFAULT_PROBABILITY_TABLE = {
 }
 
 
+def _build_probability_arrays(probability_table: dict) -> tuple:
+    """Flatten an age -> (qx, px) table into arrays indexed by age, from age 0."""
+    max_age = max(probability_table)
+    min_qx, min_px = probability_table[min(probability_table)]
+    qx = np.full(max_age + 1, min_qx)
+    px = np.full(max_age + 1, min_px)
+    for age, (age_qx, age_px) in probability_table.items():
+        qx[age] = age_qx
+        px[age] = age_px
+    return qx, px
+
+
+# Lookup arrays for the default table; ages past the end are clipped to the last entry
+_QX, _PX = _build_probability_arrays(DEFAULT_PROBABILITY_TABLE)
+_QXPX = _QX * _PX
+
+# Shared by every execution without copying, so guard them against mutation
+for _table in (_QX, _PX, _QXPX):
+    _table.flags.writeable = False
+del _table
+
+
+_DATE_FORMATS = [
+    '%Y-%m-%d',
+    '%Y-%m-%d %H:%M:%S',
+    '%d/%m/%Y',
+    '%m/%d/%Y',
+    '%d-%m-%Y',
+]
+
+# Fast paths for exactly the layouts in _DATE_FORMATS
+_YMD_RE = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})(?:\s+(\d{1,2}):(\d{1,2}):(\d{1,2}))?')
+_DMY_RE = re.compile(r'(\d{1,2})([/-])(\d{1,2})\2(\d{4})')
+
+
 def parse_date(date_str: str) -> datetime:
-    """Parse date string in various formats."""
-    formats = [
-        '%Y-%m-%d',
-        '%Y-%m-%d %H:%M:%S',
-        '%d/%m/%Y',
-        '%m/%d/%Y',
-        '%d-%m-%Y',
-    ]
-    for fmt in formats:
+    """
+    Parse date string in various formats.
+
+    Accepts the layouts in _DATE_FORMATS: Y-m-d (optionally with H:M:S),
+    d/m/Y, then m/d/Y, and d-m-Y.
+    """
+    date_str = date_str.strip()
+    try:
+        match = _YMD_RE.fullmatch(date_str)
+        if match:
+            year, month, day, *clock = match.groups()
+            time = [int(part) for part in clock] if clock[0] else []
+            return datetime(int(year), int(month), int(day), *time)
+
+        match = _DMY_RE.fullmatch(date_str)
+        if match:
+            first, sep, second, year = match.groups()
+            try:
+                return datetime(int(year), int(second), int(first))
+            except ValueError:
+                if sep != '/':
+                    raise
+                # Month first is only accepted with slashes (12/25/1990)
+                return datetime(int(year), int(first), int(second))
+    except ValueError:
+        pass
+
+    for fmt in _DATE_FORMATS:
         try:
-            return datetime.strptime(date_str.strip(), fmt)
+            return datetime.strptime(date_str, fmt)
         except ValueError:
             continue
     raise ValueError(f"Unable to parse date: {date_str}")
 
 
-def calculate_age(birth_date: datetime, valuation_date: datetime) -> int:
-    """Calculate age in years (matching Excel's INT((valuation_date - birth_date + 1) / 365.25))."""
-    days = (valuation_date - birth_date).days + 1
-    return int(days / 365.25)
+def calculate_ages(birth_ordinals: np.ndarray, valuation_date: datetime) -> np.ndarray:
+    """Calculate ages in years (matching Excel's INT((valuation_date - birth_date + 1) / 365.25))."""
+    days = valuation_date.toordinal() - birth_ordinals + 1
+    # 365.25 days == 1461 / 4; negative spans truncate toward zero like int()
+    return np.where(days >= 0, days * 4 // 1461, -(-days * 4 // 1461))
+
+
+@functools.lru_cache(maxsize=32)
+def _growth_table(rate: float, max_years: int) -> np.ndarray:
+    """
+    Cumulative salary growth factors (1 + rate) ** years for years 0..max_years.
+
+    Executions share a handful of (rate, horizon) assumptions, so the table is
+    built once per combination and reused read-only.
+    """
+    growth = (1 + rate) ** np.arange(max_years + 1)
+    growth.flags.writeable = False
+    return growth
+
+
+def _project_cashflows(salary, ages0, retirement_age, growth, qx_table, px_table, qxpx_table):
+    """
+    Project future salary and expected death outflow for all employees at once.
+
+    Expands every employee into one row per age from current age to retirement
+    and looks up the precomputed growth and probability factors for each row.
+    Returns flat columns ordered by employee then age:
+    (emp_idx, age, future_salary, px, qx, edo).
+    """
+    counts = np.maximum(retirement_age - ages0, 0)
+    emp_idx = np.repeat(np.arange(len(salary)), counts)
 
+    # Position of each row within its employee's run: 0, 1, 2, ...
+    starts = np.cumsum(counts) - counts
+    step = np.arange(len(emp_idx)) - np.repeat(starts, counts)
+    age = ages0[emp_idx] + step
 
-def get_probability(age: int, probability_table: dict) -> tuple:
-    """Get death (qx) and survival (px) probabilities for a given age."""
-    if age in probability_table:
-        return probability_table[age]
-    # If age not in table, use closest boundary
-    if age < min(probability_table.keys()):
-        return probability_table[min(probability_table.keys())]
-    return probability_table[max(probability_table.keys())]
+    # First projected year is already one year of salary growth
+    future_salary = salary[emp_idx] * growth[step + 1]
 
+    t = np.clip(age, 0, len(qx_table) - 1)
+    return emp_idx, age, future_salary, px_table[t], qx_table[t], future_salary * qxpx_table[t]
+
+
+def _project_cashflows_loop(salary, ages0, retirement_age, growth, qx_table, px_table, qxpx_table):
+    """
+    Loop form of _project_cashflows, compiled with numba when it is installed.
 
-def process_cashflow(input_file: BinaryIO) -> tuple[str, int, int]:
+    Each employee writes into its own slice of the preallocated outputs, so the
+    outer loop can run in parallel without a shared row counter.
+    """
+    n = len(salary)
+    counts = np.maximum(retirement_age - ages0, 0)
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+    total = offsets[n]
+
+    out_emp = np.empty(total, dtype=np.int64)
+    out_age = np.empty(total, dtype=np.int64)
+    out_fs = np.empty(total, dtype=np.float64)
+    out_px = np.empty(total, dtype=np.float64)
+    out_qx = np.empty(total, dtype=np.float64)
+    out_edo = np.empty(total, dtype=np.float64)
+    last = len(qx_table) - 1
+
+    for i in prange(n):
+        pos = offsets[i]
+        base_salary = salary[i]
+        # The first projected year already includes one year of salary growth
+        year = 1
+        for age in range(ages0[i], retirement_age):
+            t = min(max(age, 0), last)
+            future_salary = base_salary * growth[year]
+            out_emp[pos] = i
+            out_age[pos] = age
+            out_fs[pos] = future_salary
+            out_px[pos] = px_table[t]
+            out_qx[pos] = qx_table[t]
+            out_edo[pos] = future_salary * qxpx_table[t]
+            year += 1
+            pos += 1
+
+    return out_emp, out_age, out_fs, out_px, out_qx, out_edo
+
+
+# Employee count from which the NumPy path is split across worker processes.
+# Serial projection takes about 0.6 s per million employees; starting the
+# spawn pool costs about 0.5 s on first use, after which it is reused.
+PARALLEL_MIN_EMPLOYEES = 1_000_000
+
+# Result rows converted to Python objects and written per batch
+WRITE_BATCH_ROWS = 100_000
+
+# dtypes of the columns returned by the projection kernels
+_OUTPUT_DTYPES = (np.int64, np.int64, np.float64, np.float64, np.float64, np.float64)
+
+
+# Process-pool output columns are memory-mapped files created here (RAM-backed when possible)
+_SCRATCH_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+_pool = None
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """Return the long-lived worker pool, starting it on first use."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def _shutdown_pool():
+    """Stop the worker pool, if one was started."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+atexit.register(_shutdown_pool)
+
+
+def _project_chunk(paths, row_start, emp_start, salary, ages0, *tables):
+    """Project one chunk of employees into the shared output columns (worker side)."""
+    columns = _project_cashflows(salary, ages0, *tables)
+    for i, (path, dtype, column) in enumerate(zip(paths, _OUTPUT_DTYPES, columns)):
+        if not len(column):
+            continue
+        out = np.memmap(
+            path, dtype=dtype, mode='r+', offset=row_start * np.dtype(dtype).itemsize, shape=(len(column),),
+        )
+        # Employee indexes are relative to the chunk
+        out[:] = column + emp_start if i == 0 else column
+        del out
+
+
+def _project_cashflows_parallel(salary, ages0, retirement_age, *tables):
+    """
+    Run _project_cashflows over employee chunks in a pool of processes.
+
+    Employees are independent, so each worker projects a contiguous slice and
+    writes its rows into memory-mapped output columns at a precomputed offset;
+    only the small input slices are pickled. The files are unlinked once the
+    workers finish and the returned arrays keep using the same mappings, so
+    results are never copied. Small inputs, single-CPU hosts and daemonic
+    processes (which may not start children) run in-process instead.
+    """
+    n = len(salary)
+    workers = os.cpu_count() or 1
+    if n < PARALLEL_MIN_EMPLOYEES or workers < 2 or multiprocessing.current_process().daemon:
+        return _project_cashflows(salary, ages0, retirement_age, *tables)
+
+    row_ends = np.cumsum(np.maximum(retirement_age - ages0, 0))
+    total = int(row_ends[-1])
+    if not total:
+        return _project_cashflows(salary, ages0, retirement_age, *tables)
+    bounds = np.linspace(0, n, workers + 1).astype(np.int64)
+
+    with tempfile.TemporaryDirectory(dir=_SCRATCH_DIR) as scratch:
+        paths = [os.path.join(scratch, f'column{i}') for i in range(len(_OUTPUT_DTYPES))]
+        columns = [
+            np.memmap(path, dtype=dtype, mode='w+', shape=(total,))
+            for path, dtype in zip(paths, _OUTPUT_DTYPES)
+        ]
+        pool = _get_pool(workers)
+        try:
+            futures = [
+                pool.submit(
+                    _project_chunk, paths, int(row_ends[lo - 1]) if lo else 0, int(lo),
+                    salary[lo:hi], ages0[lo:hi], retirement_age, *tables,
+                )
+                for lo, hi in zip(bounds[:-1], bounds[1:])
+            ]
+            for future in futures:
+                future.result()
+        except BrokenProcessPool:
+            # A dead worker leaves the pool unusable; start a fresh one next time
+            _shutdown_pool()
+            raise
+
+    return tuple(column.view(np.ndarray) for column in columns)
+
+
+if njit is not None:
+    # prange already spreads the compiled kernel across cores
+    _compute = njit(cache=True, parallel=True)(_project_cashflows_loop)
+else:
+    _compute = _project_cashflows_parallel
+
+
+def process_cashflow(
+    input_file: BinaryIO, output_file: TextIO, now: datetime | None = None,
+) -> tuple[int, int]:
     """
     Process the input CSV file and generate cashflow calculations.
 
@@ -87,112 +338,105 @@ def process_cashflow(input_file: BinaryIO) -> tuple[str, int, int]:
     Or simpler format:
     - Just employee data with default assumptions
 
+    The output CSV is written to output_file, a writable text file opened
+    with newline=''. It is streamed in batches rather than built in memory.
+    now is the generation timestamp written to the header (defaults to the
+    current time).
+
     Returns:
-        tuple: (output_csv_string, input_row_count, output_row_count)
+        tuple: (input_row_count, output_row_count)
     """
-    content = input_file.read()
-    if isinstance(content, bytes):
-        content = content.decode('utf-8')
-
-    lines = content.strip().split('\n')
-    reader = csv.reader(io.StringIO(content))
-    rows = list(reader)
-
     # Default assumptions
     valuation_date = datetime(2024, 12, 31)
     discount_rate = 0.0545
     salary_increase_rate = 0.05
     retirement_age = 60
-    probability_table = DEFAULT_PROBABILITY_TABLE.copy()
 
-    # Parse the file - detect format
-    employees = []
+    # Parse the file - detect format. Employee fields are kept as parallel
+    # columns so they feed straight into the NumPy arrays below.
+    emp_ids = []
+    emp_names = []
+    birth_ordinals = []
+    salaries = []
     assumptions_found = False
 
-    for i, row in enumerate(rows):
-        if not row or all(not cell.strip() for cell in row):
-            continue
+    # Stream rows straight from the upload instead of reading it into memory
+    if isinstance(input_file, io.TextIOBase):
+        text_file = input_file
+    else:
+        text_file = io.TextIOWrapper(input_file, encoding='utf-8', newline='')
 
-        # Check for assumptions section
-        if len(row) >= 2:
-            key = row[0].strip().lower()
-            if key == 'valuation_date':
-                valuation_date = parse_date(row[1])
-                assumptions_found = True
-                continue
-            elif key == 'discount_rate':
-                discount_rate = float(row[1])
-                assumptions_found = True
-                continue
-            elif key == 'salary_increase_rate':
-                salary_increase_rate = float(row[1])
-                assumptions_found = True
-                continue
-            elif key == 'retirement_age':
-                retirement_age = int(row[1])
-                assumptions_found = True
+    try:
+        for row in csv.reader(text_file):
+            if not row or all(not cell.strip() for cell in row):
                 continue
 
-        # Check for header row
-        if len(row) >= 5:
-            first_cell = row[0].strip().lower()
-            if first_cell in ('emp_id', 'employee_id', 'id'):
-                continue  # Skip header
-
-            # Try to parse as employee data
-            try:
-                emp_id = row[0].strip()
-                emp_name = row[1].strip()
-                date_birth = parse_date(row[2])
-                date_joining = parse_date(row[3])
-                salary = float(row[4].replace(',', ''))
-
-                employees.append({
-                    'emp_id': emp_id,
-                    'emp_name': emp_name,
-                    'date_birth': date_birth,
-                    'date_joining': date_joining,
-                    'salary': salary,
-                })
-            except (ValueError, IndexError):
-                continue
-
-    input_row_count = len(employees)
-
-    # Calculate cashflows for each employee
-    output_rows = []
-
-    for emp in employees:
-        current_age = calculate_age(emp['date_birth'], valuation_date)
-
-        # Project from current age to retirement
-        future_salary = emp['salary'] * (1 + salary_increase_rate)  # First year projection
-
-        for age in range(current_age, retirement_age):
-            qx, px = get_probability(age, probability_table)
-
-            expected_death_outflow = future_salary * px * qx
-
-            output_rows.append({
-                'emp_id': emp['emp_id'],
-                'emp_name': emp['emp_name'],
-                'age': age,
-                'future_salary': round(future_salary, 2),
-                'survival_prob': px,
-                'death_prob': qx,
-                'expected_death_outflow': round(expected_death_outflow, 6),
-            })
-
-            # Project salary for next year
-            future_salary = future_salary * (1 + salary_increase_rate)
+            # Check for assumptions section
+            if len(row) >= 2:
+                key = row[0].strip().lower()
+                if key == 'valuation_date':
+                    valuation_date = parse_date(row[1])
+                    assumptions_found = True
+                    continue
+                elif key == 'discount_rate':
+                    discount_rate = float(row[1])
+                    assumptions_found = True
+                    continue
+                elif key == 'salary_increase_rate':
+                    salary_increase_rate = float(row[1])
+                    assumptions_found = True
+                    continue
+                elif key == 'retirement_age':
+                    retirement_age = int(row[1])
+                    assumptions_found = True
+                    continue
+
+            # Check for header row
+            if len(row) >= 5:
+                first_cell = row[0].strip().lower()
+                if first_cell in ('emp_id', 'employee_id', 'id'):
+                    continue  # Skip header
+
+                # Try to parse as employee data
+                try:
+                    emp_id = row[0].strip()
+                    emp_name = row[1].strip()
+                    date_birth = parse_date(row[2])
+                    parse_date(row[3])  # date_joining is validated but not used
+                    salary = float(row[4].replace(',', ''))
+                except (ValueError, IndexError):
+                    continue
+
+                emp_ids.append(emp_id)
+                emp_names.append(emp_name)
+                birth_ordinals.append(date_birth.toordinal())
+                salaries.append(salary)
+    finally:
+        if text_file is not input_file:
+            # Leave the caller's file open; it is closed by whoever opened it
+            text_file.detach()
+
+    input_row_count = len(emp_ids)
+
+    # Calculate cashflows for all employees in one vectorized pass
+    salaries = np.asarray(salaries, dtype=np.float64)
+    current_ages = calculate_ages(np.asarray(birth_ordinals, dtype=np.int64), valuation_date)
+
+    max_years = max(retirement_age - int(current_ages.min(initial=retirement_age)), 0)
+    growth = _growth_table(salary_increase_rate, max_years)
+
+    emp_idx, ages, future_salaries, survival, death, outflows = _compute(
+        salaries, current_ages, retirement_age, growth, _QX, _PX, _QXPX,
+    )
+
+    output_row_count = len(emp_idx)
 
     # Generate output CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
+    writer = csv.writer(output_file)
 
     # Write summary header
     writer.writerow(['Cashflow Calculation Results'])
-    writer.writerow(['Generated', datetime.now().strftime('%Y-%m-%d %H:%M:%S')])
+    writer.writerow(['Generated', (now or datetime.now()).strftime('%Y-%m-%d %H:%M:%S')])
     writer.writerow([])
 
     # Write assumptions
@@ -207,17 +451,36 @@ def process_cashflow(input_file: BinaryIO) -> tuple[str, int, int]:
     writer.writerow(['Calculation Results'])
     writer.writerow(['emp_id', 'emp_name', 'age', 'future_salary', 'survival_prob', 'death_prob', 'expected_death_outflow'])
 
-    for row in output_rows:
-        writer.writerow([
-            row['emp_id'],
-            row['emp_name'],
-            row['age'],
-            row['future_salary'],
-            row['survival_prob'],
-            row['death_prob'],
-            row['expected_death_outflow'],
-        ])
-
-    output_row_count = len(output_rows)
+    if pl is not None:
+        # Nulls are written as empty fields; polars would quote an empty string
+        ids = pl.Series([emp_id or None for emp_id in emp_ids], dtype=pl.Utf8)
+        names = pl.Series([emp_name or None for emp_name in emp_names], dtype=pl.Utf8)
+
+    for start in range(0, output_row_count, WRITE_BATCH_ROWS):
+        batch = slice(start, start + WRITE_BATCH_ROWS)
+        if pl is not None:
+            # Formatted natively into a string, then written through output_file.
+            # Passing output_file itself lets polars write to its fileno(),
+            # bypassing wrappers such as the gzip stream.
+            output_file.write(pl.DataFrame({
+                'emp_id': ids.gather(emp_idx[batch]),
+                'emp_name': names.gather(emp_idx[batch]),
+                'age': ages[batch],
+                'future_salary': np.round(future_salaries[batch], 2),
+                'survival_prob': survival[batch],
+                'death_prob': death[batch],
+                'expected_death_outflow': np.round(outflows[batch], 6),
+            }).write_csv(None, include_header=False, line_terminator='\r\n'))
+            continue
 
-    return output.getvalue(), input_row_count, output_row_count
+        writer.writerows(zip(
+            (emp_ids[i] for i in emp_idx[batch].tolist()),
+            (emp_names[i] for i in emp_idx[batch].tolist()),
+            ages[batch].tolist(),
+            np.round(future_salaries[batch], 2).tolist(),
+            survival[batch].tolist(),
+            death[batch].tolist(),
+            np.round(outflows[batch], 6).tolist(),
+        ))
+
+    return input_row_count, output_row_count
@@ -1,3 +1,376 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from . import services
+from .models import Execution
+from .services import calculate_ages, parse_date, process_cashflow
+from .tasks import OUTPUT_COMPRESSLEVEL, run_execution
+
+NOW = datetime(2025, 1, 1, 12, 0, 0)
+
+
+def make_input(employees):
+    """Build an input CSV (as bytes) from (emp_id, emp_name, date_birth, salary) tuples."""
+    lines = [
+        'valuation_date,2024-12-31',
+        'salary_increase_rate,0.05',
+        'retirement_age,60',
+        'emp_id,emp_name,date_birth,date_joining,salary',
+    ]
+    for emp_id, emp_name, date_birth, salary in employees:
+        name = emp_name.replace('"', '""')
+        lines.append(f'{emp_id},"{name}",{date_birth},2020-01-01,{salary}')
+    return '\n'.join(lines).encode('utf-8')
+
+
+def run_gzipped(data):
+    """Run process_cashflow through the same gzip text stack as run_execution."""
+    with tempfile.TemporaryFile() as tmp:
+        with gzip.GzipFile(fileobj=tmp, mode='wb', compresslevel=OUTPUT_COMPRESSLEVEL) as gz, \
+                io.TextIOWrapper(gz, encoding='utf-8', newline='') as output:
+            counts = process_cashflow(io.BytesIO(data), output, now=NOW)
+        tmp.seek(0)
+        return counts, gzip.decompress(tmp.read()).decode('utf-8')
+
+
+def result_rows(output_csv):
+    """Parse the calculation rows of an output CSV, with numbers as floats."""
+    lines = output_csv.split('\r\n')
+    start = lines.index('emp_id,emp_name,age,future_salary,survival_prob,death_prob,expected_death_outflow')
+    rows = csv.reader(lines[start + 1:])
+    return [row[:2] + [float(value) for value in row[2:]] for row in rows if row]
+
+
+class GzipOutputTests(SimpleTestCase):
+    """Output written through GzipFile + TextIOWrapper, with and without polars."""
+
+    def setUp(self):
+        names = ['Plain', 'With, comma', 'Quote "q"', '', 'Ünïcode']
+        self.data = make_input(
+            (f'E{i}', names[i % len(names)], f'{1960 + i % 45}-{i % 12 + 1:02d}-15', 0.5 + i * 37.25)
+            for i in range(3000)
+        )
+
+    def test_csv_writer_output_decompresses(self):
+        with mock.patch.object(services, 'pl', None):
+            counts, output = run_gzipped(self.data)
+
+        self.assertEqual(counts[0], 3000)
+        self.assertTrue(output.startswith('Cashflow Calculation Results\r\nGenerated,2025-01-01 12:00:00\r\n'))
+        self.assertEqual(len(result_rows(output)), counts[1])
+
+    @skipUnless(services.pl is not None, 'polars is not installed')
+    def test_polars_output_matches_csv_writer(self):
+        with mock.patch.object(services, 'WRITE_BATCH_ROWS', 7000):
+            counts, output = run_gzipped(self.data)
+            with mock.patch.object(services, 'pl', None):
+                expected_counts, expected = run_gzipped(self.data)
+
+        self.assertEqual(counts, expected_counts)
+        header_end = expected.index('\r\nCalculation Results')
+        self.assertEqual(output[:header_end], expected[:header_end])
+        self.assertEqual(result_rows(output), result_rows(expected))
+
+
+class ParseDateTests(SimpleTestCase):
+
+    def test_supported_formats(self):
+        cases = {
+            '1990-12-25': datetime(1990, 12, 25),
+            ' 1990-1-5 ': datetime(1990, 1, 5),
+            '1990-12-25 10:30:15': datetime(1990, 12, 25, 10, 30, 15),
+            '25/12/1990': datetime(1990, 12, 25),
+            '12/25/1990': datetime(1990, 12, 25),
+            '05/06/1990': datetime(1990, 6, 5),  # day first when ambiguous
+            '25-12-1990': datetime(1990, 12, 25),
+        }
+        for value, expected in cases.items():
+            with self.subTest(value=value):
+                self.assertEqual(parse_date(value), expected)
+
+    def test_rejects_other_layouts(self):
+        for value in ('1990/12/25', '12-25-1990', '25/12/1990 10:00:00', '31/02/1990', '90-12-25', 'abc'):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    parse_date(value)
+
+
+class CalculateAgesTests(SimpleTestCase):
+
+    def test_365_25_day_boundaries(self):
+        valuation_date = datetime(2024, 12, 31)
+        # valuation_date - birth_date + 1, in days, on both sides of multiples of 365.25
+        spans = [1, 365, 366, 730, 731, 1095, 1096, 1460, 1461, 21914, 21915, 0, -365, -366]
+        birth_ordinals = np.array([valuation_date.toordinal() + 1 - days for days in spans])
+
+        ages = calculate_ages(birth_ordinals, valuation_date)
+
+        self.assertEqual(ages.tolist(), [int(days / 365.25) for days in spans])
+
+
+class KernelParityTests(SimpleTestCase):
+    """The NumPy and loop kernels must produce identical columns."""
+
+    def project_both(self, salary, ages0):
+        growth = 1.05 ** np.arange(100)
+        tables = (services._QX, services._PX, services._QXPX)
+        return (
+            services._project_cashflows(salary, ages0, 60, growth, *tables),
+            services._project_cashflows_loop(salary, ages0, 60, growth, *tables),
+        )
+
+    def assertColumnsEqual(self, first, second):
+        self.assertEqual(len(first), len(second))
+        for column, other in zip(first, second):
+            self.assertEqual(column.shape, other.shape)
+            np.testing.assert_allclose(column, other, rtol=1e-12)
+
+    def test_ages_below_within_and_above_table(self):
+        # The table covers 20-73; retirement is 60
+        ages0 = np.array([-2, 0, 15, 19, 20, 35, 59, 60, 65, 80], dtype=np.int64)
+        salary = np.linspace(1000, 10000, len(ages0))
+
+        vectorized, loop = self.project_both(salary, ages0)
+
+        self.assertColumnsEqual(vectorized, loop)
+        emp_idx, age, future_salary, px, qx, edo = vectorized
+        self.assertEqual(len(age), sum(max(60 - a, 0) for a in ages0))
+        # Ages below the table use its first entry
+        self.assertEqual(qx[(emp_idx == 0) & (age == -2)].tolist(), [services.DEFAULT_PROBABILITY_TABLE[20][0]])
+        self.assertEqual(future_salary[0], salary[0] * 1.05)
+
+    def test_empty_input(self):
+        empty = np.array([], dtype=np.int64)
+        vectorized, loop = self.project_both(empty.astype(np.float64), empty)
+
+        self.assertColumnsEqual(vectorized, loop)
+        self.assertEqual([len(column) for column in vectorized], [0] * 6)
+
+
+class ParallelProjectionTests(SimpleTestCase):
+    """_project_cashflows_parallel, forced on with a small threshold."""
+
+    def setUp(self):
+        scratch = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, scratch)
+        self.scratch = scratch
+        for patcher in (
+            mock.patch.object(services, 'PARALLEL_MIN_EMPLOYEES', 10),
+            mock.patch.object(services, '_SCRATCH_DIR', scratch),
+            mock.patch.object(services.os, 'cpu_count', return_value=3),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(services._shutdown_pool)
+
+    def test_matches_serial_projection(self):
+        rng = np.random.default_rng(0)
+        # The last chunk is all past retirement, so its worker writes no rows
+        ages0 = np.concatenate([rng.integers(-3, 75, 400), np.full(200, 65)]).astype(np.int64)
+        salary = rng.uniform(1000, 20000, len(ages0))
+        args = (60, 1.05 ** np.arange(100), services._QX, services._PX, services._QXPX)
+
+        parallel = services._project_cashflows_parallel(salary, ages0, *args)
+        # Second call reuses the running pool
+        again = services._project_cashflows_parallel(salary, ages0, *args)
+        serial = services._project_cashflows(salary, ages0, *args)
+
+        self.assertIsNotNone(services._pool)
+        for column, repeat, expected in zip(parallel, again, serial):
+            self.assertIs(type(column), np.ndarray)
+            self.assertEqual(column.dtype, expected.dtype)
+            np.testing.assert_array_equal(column, expected)
+            np.testing.assert_array_equal(repeat, expected)
+        # Scratch column files are removed once the workers finish
+        self.assertEqual(os.listdir(self.scratch), [])
+
+    def test_small_input_stays_in_process(self):
+        salary = np.array([1000.0, 2000.0])
+        ages0 = np.array([30, 40], dtype=np.int64)
+        args = (60, 1.05 ** np.arange(100), services._QX, services._PX, services._QXPX)
+
+        columns = services._project_cashflows_parallel(salary, ages0, *args)
+
+        self.assertIsNone(services._pool)
+        self.assertEqual(len(columns[0]), 50)
+
+
+class ProcessCashflowTests(SimpleTestCase):
+
+    def test_sample_input(self):
+        output = io.StringIO(newline='')
+        with open(settings.BASE_DIR / 'sample_input.csv', 'rb') as f:
+            counts = process_cashflow(f, output, now=NOW)
+
+        self.assertEqual(counts, (7, 154))
+        lines = output.getvalue().split('\r\n')
+        self.assertEqual(lines[1], 'Generated,2025-01-01 12:00:00')
+        self.assertIn('1,Employee 1,35,11844.26,0.99771,0.00229,27.061249', lines)
+        self.assertIn('1,Employee 1,43,17499.37,0.996789,0.003211,56.01005', lines)
+
+
+class TempMediaTestCase(TestCase):
+    """TestCase storing uploaded and generated files in a temporary MEDIA_ROOT."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class RunExecutionTests(TempMediaTestCase):
+
+    def test_writes_gzipped_output(self):
+        with open(settings.BASE_DIR / 'sample_input.csv', 'rb') as f:
+            data = f.read()
+        execution = Execution.objects.create(
+            input_file=SimpleUploadedFile('input.csv', data), status='processing',
+        )
+
+        run_execution(execution.id)
+
+        execution.refresh_from_db()
+        self.assertEqual(execution.status, 'completed')
+        self.assertEqual((execution.input_rows, execution.output_rows), (7, 154))
+        self.assertIsNotNone(execution.completed_at)
+        self.assertTrue(execution.output_file.name.endswith('.csv.gz'))
+
+        with execution.output_file.open('rb') as f:
+            output = gzip.decompress(f.read()).decode('utf-8')
+        expected = io.StringIO(newline='')
+        process_cashflow(io.BytesIO(data), expected, now=NOW)
+        # Only the 'Generated' timestamp line may differ
+        output_lines = output.split('\r\n')
+        expected_lines = expected.getvalue().split('\r\n')
+        del output_lines[1], expected_lines[1]
+        self.assertEqual(output_lines, expected_lines)
+
+    def test_failure_is_recorded(self):
+        execution = Execution.objects.create(
+            input_file=SimpleUploadedFile('input.csv', b'x'), status='processing',
+        )
+
+        with mock.patch('calculator.tasks.process_cashflow', side_effect=ValueError('boom')):
+            run_execution(execution.id)
+
+        execution.refresh_from_db()
+        self.assertEqual(execution.status, 'failed')
+        self.assertEqual(execution.error_message, 'boom')
+
+
+class ProcessViewTests(TestCase):
+
+    def setUp(self):
+        self.execution = Execution.objects.create(input_file='inputs/input.csv', status='pending')
+        self.url = reverse('calculator:process', args=[self.execution.id])
+
+    @mock.patch('calculator.views.run_execution.delay')
+    def test_queues_pending_execution_once(self, delay):
+        response = self.client.post(self.url)
+
+        self.assertRedirects(response, reverse('calculator:detail', args=[self.execution.id]))
+        delay.assert_called_once_with(self.execution.id)
+        self.execution.refresh_from_db()
+        self.assertEqual(self.execution.status, 'processing')
+
+        # The execution is already claimed, so a second submit is not queued
+        response = self.client.post(self.url, follow=True)
+
+        delay.assert_called_once()
+        self.assertContains(response, 'This execution has already been processed.')
+
+    @mock.patch('calculator.views.run_execution.delay')
+    def test_failed_execution_can_be_requeued(self, delay):
+        Execution.objects.filter(id=self.execution.id).update(status='failed')
+
+        self.client.post(self.url)
+
+        delay.assert_called_once_with(self.execution.id)
+
+    @mock.patch('calculator.views.run_execution.delay', side_effect=ConnectionError('broker down'))
+    def test_queue_failure_marks_execution_failed(self, delay):
+        response = self.client.post(self.url, follow=True)
+
+        self.execution.refresh_from_db()
+        self.assertEqual(self.execution.status, 'failed')
+        self.assertEqual(self.execution.error_message, 'Could not queue processing: broker down')
+        self.assertContains(response, 'Processing failed: broker down')
+
+
+class DownloadViewTests(TempMediaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.execution = Execution.objects.create(
+            input_file=SimpleUploadedFile('input.csv', b'emp_id\r\n'), status='completed',
+        )
+        self.gzipped = gzip.compress(b'Cashflow Calculation Results\r\n')
+        self.execution.output_file.save('output_1.csv.gz', ContentFile(self.gzipped))
+
+    def download(self, name):
+        return self.client.get(reverse(f'calculator:{name}', args=[self.execution.id]))
+
+    def test_gzip_output_is_decoded_by_the_browser(self):
+        response = self.download('download_output')
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="output_1.csv"')
+        self.assertEqual(b''.join(response.streaming_content), self.gzipped)
+
+    def test_plain_output_and_input_are_served_as_is(self):
+        self.execution.output_file.save('output_1.csv', ContentFile(b'plain\r\n'))
+
+        for name, filename, content in (
+            ('download_output', 'output_1.csv', b'plain\r\n'),
+            ('download_input', 'input.csv', b'emp_id\r\n'),
+        ):
+            with self.subTest(name=name):
+                response = self.download(name)
+                self.assertNotIn('Content-Encoding', response)
+                self.assertEqual(response['Content-Disposition'], f'attachment; filename="{filename}"')
+                self.assertEqual(b''.join(response.streaming_content), content)
+
+    @override_settings(SENDFILE_BACKEND='nginx', SENDFILE_URL_PREFIX='/protected/')
+    def test_nginx_redirects_with_quoted_path(self):
+        Execution.objects.filter(id=self.execution.id).update(input_file='inputs/my input.csv')
+
+        response = self.download('download_input')
+
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/inputs/my%20input.csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="my input.csv"')
+        self.assertEqual(response.content, b'')
+
+    @override_settings(SENDFILE_BACKEND='nginx', SENDFILE_URL_PREFIX='/protected/')
+    def test_nginx_sends_gzip_output_as_archive(self):
+        response = self.download('download_output')
+
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/' + self.execution.output_file.name)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="output_1.csv.gz"')
+
+    @override_settings(SENDFILE_BACKEND='apache')
+    def test_apache_sends_file_path(self):
+        response = self.download('download_output')
+
+        self.assertEqual(response['X-Sendfile'], self.execution.output_file.path)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="output_1.csv.gz"')
@@ -1,17 +1,20 @@
-from datetime import datetime
+from urllib.parse import quote
 
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import FileResponse
+from django.http import FileResponse, HttpResponse
 from django.contrib import messages
-from django.core.files.base import ContentFile
+from django.utils.http import content_disposition_header
 
 from .models import Execution
-from .services import process_cashflow
+from .tasks import run_execution
 
 
 def index(request):
     """Main page - upload form and execution history."""
-    executions = Execution.objects.all()[:20]
+    executions = Execution.objects.only(
+        'id', 'status', 'input_rows', 'output_rows', 'created_at',
+    )[:20]
     return render(request, 'calculator/index.html', {'executions': executions})
 
 
@@ -47,43 +50,52 @@ def detail(request, execution_id):
 
 
 def process(request, execution_id):
-    """Process the uploaded CSV file and generate output."""
+    """Queue the uploaded CSV file for processing in the background."""
     execution = get_object_or_404(Execution, id=execution_id)
 
-    if execution.status not in ('pending', 'failed'):
+    # Claim the execution atomically so a double submit cannot queue it twice
+    claimed = Execution.objects.filter(
+        id=execution.id, status__in=('pending', 'failed'),
+    ).update(status='processing')
+    if not claimed:
         messages.warning(request, 'This execution has already been processed.')
         return redirect('calculator:detail', execution_id=execution.id)
 
-    execution.status = 'processing'
-    execution.save()
-
     try:
-        # Open and process the input file
-        with execution.input_file.open('rb') as f:
-            output_csv, input_rows, output_rows = process_cashflow(f)
-
-        # Save the output file
-        output_filename = f'output_{execution.id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        execution.output_file.save(output_filename, ContentFile(output_csv.encode('utf-8')))
-
-        # Update execution record
-        execution.status = 'completed'
-        execution.input_rows = input_rows
-        execution.output_rows = output_rows
-        execution.completed_at = datetime.now()
-        execution.save()
-
-        messages.success(request, f'Processing complete! {input_rows} employees processed, {output_rows} output rows generated.')
-
+        run_execution.delay(execution.id)
     except Exception as e:
         execution.status = 'failed'
-        execution.error_message = str(e)
-        execution.save()
+        execution.error_message = f'Could not queue processing: {e}'
+        execution.save(update_fields=['status', 'error_message'])
         messages.error(request, f'Processing failed: {str(e)}')
+        return redirect('calculator:detail', execution_id=execution.id)
 
+    messages.success(request, 'Processing started. This page will refresh until the results are ready.')
     return redirect('calculator:detail', execution_id=execution.id)
 
 
+def _file_download(field_file, filename, content_type='text/csv'):
+    """
+    Build an attachment response for a stored file.
+
+    With SENDFILE_BACKEND set, the transfer is handed to the front-end server
+    (nginx X-Accel-Redirect or Apache X-Sendfile) and the worker returns at once.
+    """
+    if settings.SENDFILE_BACKEND == 'nginx':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = quote(settings.SENDFILE_URL_PREFIX + field_file.name)
+    elif settings.SENDFILE_BACKEND == 'apache':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = field_file.path
+    else:
+        return FileResponse(
+            field_file.open('rb'), content_type=content_type, as_attachment=True, filename=filename,
+        )
+
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
 def download_input(request, execution_id):
     """Download the input CSV file."""
     execution = get_object_or_404(Execution, id=execution_id)
@@ -91,9 +103,7 @@ def download_input(request, execution_id):
         messages.error(request, 'Input file not found.')
         return redirect('calculator:detail', execution_id=execution.id)
 
-    response = FileResponse(execution.input_file.open('rb'), content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{execution.input_file.name.split("/")[-1]}"'
-    return response
+    return _file_download(execution.input_file, execution.input_file.name.split("/")[-1])
 
 
 def download_output(request, execution_id):
@@ -103,12 +113,24 @@ def download_output(request, execution_id):
         messages.error(request, 'Output file not found. Please process the input first.')
         return redirect('calculator:detail', execution_id=execution.id)
 
-    response = FileResponse(execution.output_file.open('rb'), content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{execution.output_file.name.split("/")[-1]}"'
+    filename = execution.output_file.name.split("/")[-1]
+    if not filename.endswith('.gz'):
+        return _file_download(execution.output_file, filename)
+
+    if settings.SENDFILE_BACKEND:
+        # nginx drops Content-Encoding on internal redirects, so send the archive as is
+        return _file_download(execution.output_file, filename, content_type='application/gzip')
+
+    # Stored gzip-compressed; the browser decompresses it into the plain CSV
+    response = _file_download(execution.output_file, filename.removesuffix('.gz'))
+    response['Content-Encoding'] = 'gzip'
     return response
 
 
 def history(request):
     """View all execution history."""
-    executions = Execution.objects.all()
+    executions = Execution.objects.only(
+        'id', 'status', 'input_rows', 'output_rows', 'created_at', 'completed_at',
+        'input_file', 'output_file',
+    )
     return render(request, 'calculator/history.html', {'executions': executions})
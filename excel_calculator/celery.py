@@ -0,0 +1,16 @@
+"""
+Celery application for excel_calculator project.
+
+Workers are started with ``celery -A excel_calculator worker`` and pick up
+tasks from the ``tasks.py`` module of every installed app.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'excel_calculator.settings')
+
+app = Celery('excel_calculator')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -121,5 +122,17 @@ STATIC_URL = 'static/'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Hand file downloads to the front-end server instead of streaming them from
+# Django: 'nginx' (X-Accel-Redirect) or 'apache' (X-Sendfile). Unset serves
+# files directly.
+SENDFILE_BACKEND = os.environ.get('SENDFILE_BACKEND') or None
+# nginx ``internal`` location aliased to MEDIA_ROOT
+SENDFILE_URL_PREFIX = '/protected/'
+
+# Celery (background processing of executions)
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'